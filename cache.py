@@ -0,0 +1,168 @@
+"""
+LLM Response Cache Module
+Stores LLM responses in tmp/llm_cache so unchanged requests are not re-sent.
+An optional semantic tier also reuses responses for paraphrased queries.
+"""
+
+import functools
+import hashlib
+import importlib.util
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Optional
+
+import orjson
+
+CACHE_DIR = Path("tmp/llm_cache")
+
+# Semantic tier: a response is reused for another query on the same paper when
+# the two queries' embeddings have a cosine similarity of at least this much
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+SEMANTIC_THRESHOLD = 0.95
+SEMANTIC_INDEX = CACHE_DIR / "semantic.index"
+SEMANTIC_ENTRIES = CACHE_DIR / "semantic.json"
+
+stats = {"semantic_hits": 0}
+_semantic_lock = threading.Lock()
+# Whether the in-memory semantic index has entries not yet saved to disk
+_semantic_dirty = False
+
+
+def make_key(*parts: str) -> str:
+    """Return the SHA-256 hex digest of the parts joined with '|'."""
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+
+def get(key: str) -> Optional[bytes]:
+    """Return the cached response for a key, or None on a cache miss."""
+    try:
+        return (CACHE_DIR / f"{key}.json").read_bytes()
+    except FileNotFoundError:
+        return None
+
+
+def write_file(path: Path, data: bytes) -> None:
+    """Write a file under a temporary name and rename it into place.
+
+    Concurrent readers never see a partially written file.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    with open(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def set(key: str, value: bytes) -> None:
+    """Store a response for a key."""
+    write_file(CACHE_DIR / f"{key}.json", value)
+
+
+def semantic_available() -> bool:
+    """Check whether the optional semantic cache dependencies are installed."""
+    return all(
+        importlib.util.find_spec(name) for name in ("sentence_transformers", "faiss")
+    )
+
+
+@functools.lru_cache(maxsize=1)
+def _embedding_model():
+    """Load the sentence embedding model once."""
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(EMBEDDING_MODEL)
+
+
+@functools.lru_cache(maxsize=64)
+def embed(query: str):
+    """Return the normalized embedding of a query as a (1, dim) float32 array."""
+    embedding = _embedding_model().encode([query], normalize_embeddings=True)
+    return embedding.astype("float32")
+
+
+@functools.lru_cache(maxsize=1)
+def _semantic_index():
+    """Load the semantic index and its [scope, key] entries from disk once."""
+    import faiss
+    import numpy as np
+
+    try:
+        index = faiss.deserialize_index(
+            np.frombuffer(SEMANTIC_INDEX.read_bytes(), dtype=np.uint8)
+        )
+        entries = orjson.loads(SEMANTIC_ENTRIES.read_bytes())
+        if index.ntotal == len(entries):
+            return index, entries
+    except FileNotFoundError:
+        pass
+
+    # Missing or out of sync: start a new index
+    dim = _embedding_model().get_sentence_embedding_dimension()
+    return faiss.IndexFlatIP(dim), []
+
+
+def semantic_get(query: str, scope: str) -> Optional[bytes]:
+    """Return the response cached for a similar query in the same scope.
+
+    The scope identifies everything but the query (paper, provider, model),
+    so only responses for the same paper and model are reused.
+    """
+    # Embed under the lock so concurrent callers don't load the model twice
+    with _semantic_lock:
+        embedding = embed(query)
+        index, entries = _semantic_index()
+        if index.ntotal == 0:
+            return None
+
+        # Inner product of normalized embeddings is the cosine similarity
+        scores, ids = index.search(embedding, index.ntotal)
+        for score, i in zip(scores[0], ids[0]):
+            if score < SEMANTIC_THRESHOLD:
+                break
+            entry_scope, key = entries[i]
+            if entry_scope == scope:
+                value = get(key)
+                if value is not None:
+                    stats["semantic_hits"] += 1
+                    return value
+    return None
+
+
+def semantic_add(query: str, scope: str, key: str) -> None:
+    """Register the exact cache key that will hold the response for a query.
+
+    Entries point at exact cache entries, so a request that never stores a
+    response leaves an entry semantic_get skips. The index is only updated
+    in memory; semantic_save writes it to disk.
+    """
+    global _semantic_dirty
+
+    with _semantic_lock:
+        embedding = embed(query)
+        index, entries = _semantic_index()
+        if [scope, key] in entries:
+            return
+        index.add(embedding)
+        entries.append([scope, key])
+        _semantic_dirty = True
+
+
+def semantic_save() -> None:
+    """Write the semantic index and its entries to disk if they changed.
+
+    Called once at the end of a run, rather than rewriting both files for
+    every paper.
+    """
+    global _semantic_dirty
+
+    with _semantic_lock:
+        if not _semantic_dirty:
+            return
+        import faiss
+
+        index, entries = _semantic_index()
+        write_file(SEMANTIC_INDEX, faiss.serialize_index(index).tobytes())
+        write_file(SEMANTIC_ENTRIES, orjson.dumps(entries))
+        _semantic_dirty = False
@@ -2,38 +2,226 @@
 PDF to Text Conversion Module
 Converts all PDF files in inputs folder to text files in tmp/txts
 """
-import pdfplumber
+import hashlib
 import os
+import shutil
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import repeat
 from pathlib import Path
 
-def convert_pdf_to_text(pdf_path, output_path):
-    """Convert a single PDF file to text."""
+from utils import check_pdf, count_pages, is_up_to_date, worker_count
+
+# PDF backends are imported lazily inside the functions that use them.
+# PyMuPDF is the fast backend; pdfminer re-extracts PDFs it finds no text in.
+FAST_BACKEND = "pymupdf"
+
+# Minimum number of pages each process gets when splitting one PDF
+MIN_PAGES_PER_WORKER = 32
+
+# Fewer characters per page than this from a fast backend suggests it missed
+# the text layer, so the PDF is re-extracted with pdfminer
+MIN_CHARS_PER_PAGE = 20
+
+# pdfminer layout analysis settings for plain text extraction
+PDFMINER_LAPARAMS = {"char_margin": 2.0, "line_margin": 0.5}
+
+def iter_pages_pymupdf(pdf_path, start=0, stop=None):
+    """Yield the plain text of each PDF page using PyMuPDF (fast, text only)."""
+    import pymupdf
+
+    with pymupdf.open(pdf_path) as doc:
+        for page in doc.pages(start, stop):
+            yield page.get_text("text")
+
+def iter_pages_pypdfium2(pdf_path, start=0, stop=None):
+    """Yield the plain text of each PDF page using pypdfium2 (fast, text only)."""
+    import pypdfium2 as pdfium
+
+    pdf = pdfium.PdfDocument(pdf_path)
     try:
-        with pdfplumber.open(pdf_path) as pdf:
-            text = ""
-            for page in pdf.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text + "\n"
+        for index in range(start, len(pdf) if stop is None else stop):
+            page = pdf[index]
+            textpage = page.get_textpage()
+            # PDFium separates lines with \r\n
+            yield textpage.get_text_range().replace("\r\n", "\n")
+            textpage.close()
+            page.close()
+    finally:
+        pdf.close()
+
+def iter_pages_pdfminer(pdf_path, start=0, stop=None):
+    """Yield the plain text of each PDF page using pdfminer's high-level API.
+
+    Text comes straight out of pdfminer's layout pass, skipping the per-page
+    object dicts (chars, lines, rects) that pdfplumber builds on top of it.
+    """
+    from pdfminer.high_level import extract_text
+    from pdfminer.layout import LAParams
+
+    text = extract_text(
+        pdf_path,
+        page_numbers=range(start, sys.maxsize if stop is None else stop),
+        maxpages=stop or 0,
+        laparams=LAParams(**PDFMINER_LAPARAMS),
+    )
+    # pdfminer ends every page with a form feed
+    for page_text in text.split("\f"):
+        if page_text:
+            yield page_text
+
+def iter_pages_pdfplumber(pdf_path, start=0, stop=None):
+    """Yield the text of each PDF page using pdfplumber's extract_text layout.
+
+    Slower than the other backends, but reproduces pdfplumber's
+    quality-sensitive layout.
+    """
+    import pdfplumber
+
+    # pdfplumber takes 1-based page numbers
+    pages = range(start + 1, stop + 1) if stop is not None else None
+    with pdfplumber.open(pdf_path, pages=pages) as pdf:
+        for page in pdf.pages:
+            page_text = page.extract_text()
+            # Release the page's cached layout objects and text map
+            page.close()
+            if page_text:
+                yield page_text
+
+def select_backend(precise=False):
+    """Pick the PDF backend: the fastest installed one, or pdfplumber if precise."""
+    if precise:
+        return "pdfplumber"
+    return FAST_BACKEND
+
+def iter_pages(pdf_path, backend, start=0, stop=None):
+    """Yield the text of pages [start, stop) with the given backend."""
+    if backend == "pymupdf":
+        return iter_pages_pymupdf(pdf_path, start, stop)
+    if backend == "pypdfium2":
+        return iter_pages_pypdfium2(pdf_path, start, stop)
+    if backend == "pdfminer":
+        return iter_pages_pdfminer(pdf_path, start, stop)
+    return iter_pages_pdfplumber(pdf_path, start, stop)
+
+def extract_page_range(pdf_path, backend, start, stop):
+    """Return the texts of pages [start, stop) as a list (process pool task)."""
+    return list(iter_pages(pdf_path, backend, start, stop))
 
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(text)
+def iter_pages_parallel(pdf_path, backend, page_workers=1):
+    """Yield page texts, splitting a large PDF into page ranges across processes.
+
+    Each worker reopens the PDF for its own range, since parsed documents can't
+    be shared between processes. Pages are yielded in document order.
+    """
+    # Counting pages opens the PDF an extra time, so only count when it may
+    # be split
+    if page_workers > 1:
+        num_pages = count_pages(pdf_path)
+        page_workers = min(page_workers, num_pages // MIN_PAGES_PER_WORKER)
+    if page_workers <= 1:
+        yield from iter_pages(pdf_path, backend)
+        return
+
+    chunk = -(-num_pages // page_workers)
+    starts = range(0, num_pages, chunk)
+    stops = [min(start + chunk, num_pages) for start in starts]
+    with ProcessPoolExecutor(max_workers=page_workers) as executor:
+        for texts in executor.map(
+            extract_page_range,
+            repeat(pdf_path),
+            repeat(backend),
+            starts,
+            stops,
+        ):
+            yield from texts
+
+def write_pages(pages, output_path):
+    """Stream page texts to a file; return (characters, pages) written."""
+    num_chars = num_pages = 0
+    with open(
+        output_path, 'w', encoding='utf-8', newline='', buffering=1 << 20
+    ) as f:
+        for page_text in pages:
+            f.write(page_text)
+            f.write("\n")
+            num_chars += len(page_text)
+            num_pages += 1
+    return num_chars, num_pages
+
+def convert_pdf_to_text(pdf_path, output_path, precise=False, page_workers=1):
+    """Convert a single PDF file to text, streaming page by page to disk.
+
+    PyMuPDF is used, and if it finds almost no text, the PDF is re-extracted
+    with pdfminer. precise=True uses pdfplumber's extract_text (slower,
+    quality-sensitive layout) instead. page_workers > 1 lets a large PDF be
+    split into page ranges extracted by that many processes.
+    """
+    try:
+        problem = check_pdf(pdf_path)
+        if problem:
+            print(f"✗ Skipping {pdf_path.name}: {problem}")
+            return False
+
+        backend = select_backend(precise)
+        pages = iter_pages_parallel(pdf_path, backend, page_workers)
+        num_chars, num_pages = write_pages(pages, output_path)
+
+        if (backend in ("pymupdf", "pypdfium2")
+                and num_chars < MIN_CHARS_PER_PAGE * num_pages):
+            print(f"⚠ Little text found in {pdf_path.name} with {backend}, "
+                  f"retrying with pdfminer")
+            pages = iter_pages_parallel(pdf_path, "pdfminer", page_workers)
+            write_pages(pages, output_path)
 
         print(f"✓ Converted: {pdf_path.name} -> {output_path.name}")
         return True
     except Exception as e:
+        # Don't leave a partial text file that would look up to date
+        output_path.unlink(missing_ok=True)
         print(f"✗ Error converting {pdf_path.name}: {str(e)}")
         return False
 
-def convert_all_pdfs():
-    """Convert all PDFs in inputs folder to text files in tmp/txts."""
+def file_md5(path):
+    """Return the MD5 hex digest of a file's contents."""
+    with open(path, 'rb') as f:
+        return hashlib.file_digest(f, "md5").hexdigest()
+
+def link_or_copy(src, dst):
+    """Hard-link src to dst, copying instead if linking is not possible."""
+    dst.unlink(missing_ok=True)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+def convert_all_pdfs(num_workers=None, force_refresh: bool = False,
+                     precise: bool = False):
+    """Convert all PDFs in inputs folder to text files in tmp/txts.
+
+    PDFs whose text file is already up to date are skipped, and text files
+    whose PDF is no longer in inputs are removed. Converted text is
+    also kept in tmp/pdf_cache keyed by the PDF's MD5 hash, so unchanged PDFs
+    are never parsed twice, even after tmp/txts is cleared.
+
+    Args:
+        num_workers: Number of worker processes converting PDFs in parallel
+            (default: utils.worker_count(), overridable with LITQ_WORKERS)
+        force_refresh: Re-convert every PDF even if its text file is up to date
+        precise: Extract with pdfplumber's layout-preserving extract_text
+            (slower). Existing text files may come from a fast backend, so
+            they are not trusted as up to date; pdfplumber text is cached
+            separately in tmp/pdf_cache.
+    """
     # Define input and output directories
     input_dir = Path("inputs")
     output_dir = Path("tmp/txts")
+    cache_dir = Path("tmp/pdf_cache")
 
     # Create directories if they don't exist
     input_dir.mkdir(parents=True, exist_ok=True)
     output_dir.mkdir(parents=True, exist_ok=True)
+    cache_dir.mkdir(parents=True, exist_ok=True)
 
     # Get all PDF files
     pdf_files = list(input_dir.glob("*.pdf"))
@@ -46,19 +234,74 @@ def convert_all_pdfs():
     print(f"\n{'='*70}")
     print(f"PDF to Text Conversion")
     print(f"{'='*70}")
-    print(f"Found {len(pdf_files)} PDF file(s) to convert.\n")
+    print(f"Found {len(pdf_files)} PDF file(s).\n")
+
+    # tmp/txts is kept between runs, so drop text files whose PDF was removed
+    # or renamed; otherwise step 2 would still extract from them
+    stems = {pdf_file.stem for pdf_file in pdf_files}
+    for txt_file in output_dir.glob("*.txt"):
+        if txt_file.stem not in stems:
+            txt_file.unlink()
+            print(f"✓ Removed stale text file: {txt_file.name}")
 
-    # Convert each PDF file
-    successful = 0
+    # Pair each PDF with its output file (replace .pdf with .txt),
+    # skipping PDFs that were already converted
+    pending = []
+    up_to_date = 0
     for pdf_file in pdf_files:
-        # Create output filename (replace .pdf with .txt)
         output_file = output_dir / f"{pdf_file.stem}.txt"
+        if not (force_refresh or precise) and is_up_to_date(pdf_file, output_file):
+            print(f"✓ Up to date: {pdf_file.name} -> {output_file.name}")
+            up_to_date += 1
+        else:
+            pending.append((pdf_file, output_file))
+
+    # Hash the remaining PDFs in parallel (I/O bound) and reuse cached text
+    with ThreadPoolExecutor() as executor:
+        digests = list(executor.map(file_md5, [pdf for pdf, _ in pending]))
+
+    to_convert = []
+    cached = 0
+    for (pdf_file, output_file), digest in zip(pending, digests):
+        cache_name = f"{digest}-precise.txt" if precise else f"{digest}.txt"
+        cache_file = cache_dir / cache_name
+        if not force_refresh and cache_file.exists():
+            link_or_copy(cache_file, output_file)
+            # A hard link keeps the cache entry's mtime, which may predate
+            # the PDF; touch it so the next run sees it as up to date
+            os.utime(output_file)
+            print(f"✓ Cached: {pdf_file.name} -> {output_file.name}")
+            cached += 1
+        else:
+            # Never write through a link into an existing cache entry
+            output_file.unlink(missing_ok=True)
+            to_convert.append((pdf_file, output_file, cache_file))
 
-        if convert_pdf_to_text(pdf_file, output_file):
-            successful += 1
+    # Convert PDFs in parallel (each PDF is independent). Spare CPUs go to
+    # splitting large PDFs by page so one long paper doesn't hold up the batch.
+    converted = 0
+    if to_convert:
+        num_cpus = worker_count()
+        max_workers = max(1, min(num_workers or num_cpus, len(to_convert)))
+        page_workers = max(1, num_cpus // max_workers)
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = executor.map(
+                convert_pdf_to_text,
+                [pdf for pdf, _, _ in to_convert],
+                [out for _, out, _ in to_convert],
+                repeat(precise),
+                repeat(page_workers),
+                chunksize=1,
+            )
+            for (_, output_file, cache_file), ok in zip(to_convert, results):
+                if ok:
+                    link_or_copy(output_file, cache_file)
+                    converted += 1
 
+    successful = up_to_date + cached + converted
     print(f"\n{'='*70}")
-    print(f"Conversion complete: {successful}/{len(pdf_files)} files converted successfully.")
+    print(f"Conversion complete: {successful}/{len(pdf_files)} files ready "
+          f"({converted} converted, {cached} cached, {up_to_date} up to date).")
     print(f"{'='*70}\n")
 
     return successful
@@ -3,266 +3,779 @@ Reference Extraction Module
 Uses a local LLM to extract references from academic papers based on user prompts.
 """
 
+import asyncio
+import functools
+import mmap
 import os
+import re
+import string
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Tuple
+
+import orjson
+
+import cache
+from utils import env_int
 
 
 def load_text_file(txt_path: Path) -> str:
-    """Load text content from a file."""
+    """Load text content from a file.
+
+    The file is memory-mapped and decoded straight from the mapping, so no
+    intermediate bytes copy of the whole paper is made.
+    """
     try:
-        with open(txt_path, "r", encoding="utf-8") as f:
-            return f.read()
+        with open(txt_path, "rb") as f:
+            # mmap cannot map an empty file
+            if os.fstat(f.fileno()).st_size == 0:
+                return ""
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return str(mm, "utf-8")
     except Exception as e:
         print(f"✗ Error loading {txt_path.name}: {str(e)}")
         return ""
 
 
-def create_extraction_prompt(paper_text: str, user_query: str) -> str:
+# Safety cap on paper text sent to the LLM (~30k tokens)
+MAX_PAPER_CHARS = 120_000
+
+# Common section names that a query may refer to
+SECTION_NAMES = (
+    "abstract",
+    "introduction",
+    "related work",
+    "background",
+    "preliminaries",
+    "method",
+    "approach",
+    "experiment",
+    "result",
+    "evaluation",
+    "discussion",
+    "limitation",
+    "conclusion",
+)
+
+REFERENCES_HEADING_RE = re.compile(
+    r"^[^\S\n]*(?:references|bibliography)[^\S\n]*$", re.MULTILINE | re.IGNORECASE
+)
+# Lines that may be numbered section headings, such as "2 Related Work" or
+# "3.1. Setup"
+SECTION_HEADING_RE = re.compile(
+    r"^(\d+(?:\.\d+)*)\.?[^\S\n]+([A-Z][^\n]{0,60})$", re.MULTILINE
+)
+# Headings are short titles, without sentence punctuation or table values
+MAX_HEADING_WORDS = 8
+NON_TITLE_RE = re.compile(r"[.,;:]$|\d\.\d|%")
+
+# A query only narrows the text when it clearly scopes itself to sections:
+# "... section(s)", "Section 2.1", or "in/from (the) <section name>". Names
+# match as word prefixes, so "method" also covers "Methods" and "Methodology"
+SECTION_NAME_RE = re.compile(r"\b(" + "|".join(SECTION_NAMES) + r")\w*", re.IGNORECASE)
+SECTION_SCOPE_RE = re.compile(
+    r"\bsections?\b|\b(?:in|from)\s+(?:the\s+)?['\"‘“]?(?:"
+    + "|".join(SECTION_NAMES)
+    + r")",
+    re.IGNORECASE,
+)
+SECTION_NUMBER_RE = re.compile(r"\bsection\s+(\d+(?:\.\d+)*)", re.IGNORECASE)
+# An explicit paragraph title in matching quotes, e.g. "paragraph titled 'X'"
+TITLED_RE = re.compile(
+    r"\btitled\s+(?:'([^'\n]{3,}?)'|\"([^\"\n]{3,}?)\"|‘([^’\n]{3,}?)’|“([^”\n]{3,}?)”)"
+    r"(?!\w)",
+    re.IGNORECASE,
+)
+
+
+def follows_heading(previous: Tuple[int, ...], number: Tuple[int, ...]) -> bool:
+    """Check whether a heading number comes right after the previous one.
+
+    That is the first subsection of the previous heading (2 -> 2.1) or the
+    next section at the same or a higher level (2.1 -> 2.2, 2.3 -> 3).
+    """
+    if number == previous + (1,):
+        return True
+    depth = len(number)
+    return (
+        depth <= len(previous)
+        and number[:-1] == previous[: depth - 1]
+        and number[-1] == previous[depth - 1] + 1
+    )
+
+
+def find_headings(body: str) -> Optional[List[Tuple[re.Match, Tuple[int, ...]]]]:
     """
-    Create a prompt for the LLM to extract references.
+    Find the numbered section headings of the body, with their numbers.
 
-    Template instructions for the LLM:
-    1. Identify the section/paragraph mentioned in the user query
-    2. Extract all citation numbers from that section
-    3. Find the full reference details from the References section
-    4. Return structured output
+    A line only counts as a heading if it reads like a title and its number
+    continues the outline, so wrapped body lines and table rows that start
+    with a number are skipped. Returns None when the outline is ambiguous
+    (two title-like lines carry the same number), since a section could
+    then be cut short at the wrong line.
     """
-    prompt = f"""You are an expert at extracting references from academic papers.
+    headings = []
+    seen = set()
+    previous = (0,)
+    for match in SECTION_HEADING_RE.finditer(body):
+        title = match.group(2).strip()
+        if len(title.split()) > MAX_HEADING_WORDS or NON_TITLE_RE.search(title):
+            continue
+        number = tuple(int(n) for n in match.group(1).split("."))
+        if number in seen:
+            return None
+        seen.add(number)
+        if follows_heading(previous, number):
+            headings.append((match, number))
+            previous = number
+    return headings
+
+
+def section_span(
+    headings: List[Tuple[re.Match, Tuple[int, ...]]], i: int, body: str
+) -> Tuple[int, int]:
+    """Return the (start, end) span of the section under headings[i].
+
+    The section ends at the next heading of the same or a higher level.
+    """
+    heading, number = headings[i]
+    end = next(
+        (h.start() for h, n in headings[i + 1 :] if len(n) <= len(number)), len(body)
+    )
+    return heading.start(), end
+
+
+def find_sections(body: str, user_query: str) -> Optional[List[Tuple[int, int]]]:
+    """
+    Find the (start, end) spans of every section the query names.
+
+    A query names sections by their heading ("... in the Related Work
+    section", "from Results and Discussion"), by number ("Section 2.1") or
+    as a paragraph titled in quotes. Each target must match a numbered
+    heading, except a paragraph title, which may also start a line of the
+    body (a run-in paragraph heading) and then spans until the next heading.
+    Spans are returned in document order with overlaps merged. Returns None
+    when the query isn't scoped to sections or any target can't be located,
+    so the full text is used instead.
+    """
+    titles = [
+        next(group for group in match.groups() if group)
+        for match in TITLED_RE.finditer(user_query)
+    ]
+    numbers = [
+        tuple(int(n) for n in number.split("."))
+        for number in SECTION_NUMBER_RE.findall(user_query)
+    ]
+    names = []
+    if SECTION_SCOPE_RE.search(user_query):
+        found = SECTION_NAME_RE.findall(user_query)
+        names = list(dict.fromkeys(name.lower() for name in found))
+    if not (titles or numbers or names):
+        return None
+
+    headings = find_headings(body)
+    if headings is None:
+        return None
+
+    spans = []
+    for number in numbers:
+        matched = [i for i, (_, n) in enumerate(headings) if n == number]
+        if not matched:
+            return None
+        spans += [section_span(headings, i, body) for i in matched]
+
+    for name in names:
+        matched = [i for i, (h, _) in enumerate(headings) if name in h.group(2).lower()]
+        if not matched:
+            return None
+        spans += [section_span(headings, i, body) for i in matched]
+
+    for title in titles:
+        title = title.lower()
+        matched = [
+            i for i, (h, _) in enumerate(headings) if title in h.group(2).lower()
+        ]
+        if matched:
+            spans += [section_span(headings, i, body) for i in matched]
+            continue
+        # A run-in paragraph title at the start of a line
+        line = re.search(
+            r"^[^\S\n]*" + re.escape(title), body, re.MULTILINE | re.IGNORECASE
+        )
+        if line is None:
+            return None
+        end = next(
+            (h.start() for h, _ in headings if h.start() > line.start()), len(body)
+        )
+        spans.append((line.start(), end))
 
-TASK: {user_query}
+    merged = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
 
-PAPER TEXT:
-{paper_text}
+
+def select_relevant_text(
+    paper_text: str, user_query: str, max_chars: int = MAX_PAPER_CHARS
+) -> str:
+    """
+    Narrow the paper text to what the query needs before prompting the LLM.
+
+    When the query names sections that can all be located, only those
+    sections plus the References section are kept. The result is capped at max_chars.
+    A located section gets the budget first and the references are trimmed
+    from the end, since citations are useless without the text that cites
+    them. Otherwise the references are kept and the body is trimmed, so the
+    LLM can still resolve the citations it finds.
+    """
+    match = REFERENCES_HEADING_RE.search(paper_text)
+    if match is None:
+        return paper_text[:max_chars]
+
+    body = paper_text[: match.start()]
+    references = paper_text[match.start() :]
+
+    spans = find_sections(body, user_query)
+    if spans is None:
+        if len(paper_text) <= max_chars:
+            return paper_text
+        body_chars = max(0, max_chars - len(references))
+        return (body[:body_chars] + references)[:max_chars]
+
+    body = "\n".join(body[start:end] for start, end in spans)
+    separator = "\n\n[REFERENCES]\n"
+    body = body[: max(0, max_chars - len(separator))]
+    return (body + separator + references)[:max_chars]
+
+
+# Instructions shared by every extraction request. Sent at the start of the
+# system prompt so Claude prompt caching and Ollama's KV cache can reuse it.
+EXTRACTION_SYSTEM_PROMPT = """You are an expert at extracting references from academic papers.
+The user message is the text of one paper; execute the task below on it.
 
 INSTRUCTIONS:
 1. Locate the section or paragraph mentioned in the task
 2. Extract ALL citation numbers (e.g., [1], [2, 3], etc.) from that section
 3. Parse and collect all unique reference numbers
 4. Find the complete reference details from the References section
-5. Output the results in the following Python code format
-
-REQUIRED OUTPUT FORMAT - Copy this template and fill it in:
-
-```python
-# Step 1: Section text found
-section_text = '''
-[Paste the relevant section text here]
-'''
-
-# Step 2: Citation numbers extracted
-citation_pattern = r'\\[(\\d+(?:,\\s*\\d+)*)\\]'
-citations = re.findall(citation_pattern, section_text)
+5. Return the results with the extract_references schema: one entry per unique
+   reference number, sorted by number, where "num" is the reference number and
+   "citation" is the complete reference text from the References section
+"""
 
-# Step 3: Parse citation numbers
-all_refs = []
-for citation in citations:
-    refs = [int(ref.strip()) for ref in citation.split(',')]
-    all_refs.extend(refs)
+# Structured output schema shared by the Claude tool and Ollama's format
+REFERENCES_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "refs": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "num": {"type": "integer"},
+                    "citation": {"type": "string"},
+                },
+                "required": ["num", "citation"],
+            },
+        }
+    },
+    "required": ["refs"],
+}
+
+EXTRACTION_TOOL = {
+    "name": "extract_references",
+    "description": "Record the references cited in the requested part of the paper.",
+    "input_schema": REFERENCES_SCHEMA,
+}
+
+# Sampling temperature for extraction. Responses are only cached in
+# tmp/llm_cache when it is 0, since only then are they reproducible.
+LLM_TEMPERATURE = 0
+
+
+# Task line appended to the system prompt, compiled once
+TASK_PROMPT = string.Template("\nTASK: ${user_query}\n")
+
+
+@functools.lru_cache(maxsize=8)
+def create_system_prompt(user_query: str) -> Tuple[Dict, ...]:
+    """
+    Create the system prompt content blocks for a query.
 
-# Step 4: Unique reference numbers (sorted)
-unique_refs = sorted(set(all_refs))
-print(f"Total unique references: {{len(unique_refs)}}")
-print(f"Reference numbers: {{unique_refs}}")
+    Built once per query and shared by every paper's prompt. The last block
+    carries the Claude prompt caching breakpoint (ignored by Ollama). The
+    blocks are shared, so callers must not modify them.
+    """
+    return (
+        {"type": "text", "text": EXTRACTION_SYSTEM_PROMPT},
+        {
+            "type": "text",
+            "text": TASK_PROMPT.substitute(user_query=user_query),
+            "cache_control": {"type": "ephemeral"},
+        },
+    )
 
-# Step 5: Full reference details
-references = {{
-    # Fill in the reference details like this:
-    # 1: "Author Name. Title. Journal/Conference, Year.",
-    # 2: "Author Name. Title. Journal/Conference, Year.",
-}}
 
-# Step 6: Display results
-print("\\n" + "="*80)
-print("EXTRACTED REFERENCES")
-print("="*80 + "\\n")
+def create_extraction_prompt(paper_text: str, user_query: str) -> Dict:
+    """
+    Create the prompt for the LLM to extract references from one paper.
 
-for ref_num in unique_refs:
-    if ref_num in references:
-        print(f"[{{ref_num}}] {{references[ref_num]}}")
-        print()
-```
+    The query goes in the system prompt after the fixed instructions, and the
+    user message is the paper text alone. Every paper in a run then shares
+    the same prompt prefix, which Claude prompt caching and Ollama's KV cache
+    reuse instead of processing it again for each paper. Prompts are lists of
+    text content blocks so the paper text is passed through as-is.
 
-Now execute this analysis for the given task.
-"""
-    return prompt
+    Returns:
+        Dictionary with the "system" and "user" content blocks
+    """
+    return {
+        "system": create_system_prompt(user_query),
+        "user": [{"type": "text", "text": paper_text}],
+    }
 
 
-def extract_references_with_llm(
+def prepare_extraction(
     txt_path: Path,
     user_query: str,
     model: Optional[str] = None,
     provider: str = "claude",
-) -> Dict:
+    semantic_cache: bool = False,
+) -> Tuple[Optional[Dict], Optional[str], Optional[Dict]]:
     """
-    Extract references from a text file using an LLM.
+    Run the steps shared by sync and async extraction, up to the LLM call.
+
+    A response cached in tmp/llm_cache for the same provider and request
+    body is returned without calling the LLM. With semantic_cache,
+    so is a response for a similar query on the same paper.
 
     Args:
         txt_path: Path to the converted text file
         user_query: User's query about which references to extract
-        model: LLM model name (e.g., 'ministral-3', 'claude-haiku-4-5').
-               If None, generates manual template instead.
+        model: LLM model name. If None, generates manual template instead.
         provider: LLM provider to use ('ollama' or 'claude')
+        semantic_cache: Also reuse responses for paraphrased queries
 
     Returns:
-        Dictionary containing extracted references
+        (prompt, cache_key, None) when the paper needs an LLM call, or
+        (None, None, result) when it is already done (manual template mode,
+        a cache hit or an error). cache_key is None if responses are not
+        deterministic enough to cache.
     """
     print(f"\n{'=' * 70}")
     print(f"Processing: {txt_path.name}")
     print(f"Query: {user_query}")
     print(f"{'=' * 70}\n")
 
+    # Manual extraction template mode (no LLM, paper text not needed)
+    if model is None:
+        return None, None, manual_extraction_template(user_query, txt_path)
+
     # Load the paper text
     paper_text = load_text_file(txt_path)
     if not paper_text:
-        return {"error": "Failed to load text file"}
-
-    # Create the extraction prompt
-    prompt = create_extraction_prompt(paper_text, user_query)
-
-    # Manual extraction template mode (no LLM)
-    if model is None:
-        return manual_extraction_template(paper_text, user_query, txt_path)
+        return None, None, {"error": "Failed to load text file"}
 
     # Validate provider
     if provider not in ["ollama", "claude"]:
         print(f"✗ Invalid provider '{provider}'. Must be 'ollama' or 'claude'\n")
-        return {"error": f"Invalid provider: {provider}"}
+        return None, None, {"error": f"Invalid provider: {provider}"}
+
+    # Keep only the parts of the paper the query needs
+    relevant_text = select_relevant_text(paper_text, user_query)
+    if len(relevant_text) < len(paper_text):
+        print(f"   Trimmed paper text: {len(paper_text)} -> {len(relevant_text)} chars")
+
+    # Create the extraction prompt
+    prompt = create_extraction_prompt(relevant_text, user_query)
+
+    # Reuse the response of an identical earlier request. The key covers the
+    # exact request body (prompt, schema, trimmed text), so changing any of
+    # them never serves a stale response.
+    cache_key = None
+    if LLM_TEMPERATURE == 0:
+        cache_key = request_key(prompt, model, provider)
+        cached = cache.get(cache_key)
+        if cached is None and semantic_cache:
+            # Same paper, provider, model and instructions with a
+            # paraphrased query
+            scope = cache.make_key(
+                provider,
+                model,
+                paper_text,
+                EXTRACTION_SYSTEM_PROMPT,
+                orjson.dumps(REFERENCES_SCHEMA).decode(),
+            )
+            cached = cache.semantic_get(user_query, scope)
+            if cached is None:
+                cache.semantic_add(user_query, scope, cache_key)
+        if cached is not None:
+            return None, None, load_cached_result(cached, txt_path)
+
+    return prompt, cache_key, None
+
+
+def load_cached_result(cached: bytes, txt_path: Path) -> Dict:
+    """Write a cached LLM response to the outputs folder and return its result."""
+    output_file = references_output_file(txt_path)
+    output_file.write_bytes(cached)
+
+    refs = orjson.loads(cached)["refs"]
+    print(f"✓ Loaded {len(refs)} reference(s) from cache")
+    print(f"✓ Results saved to: {output_file}\n")
+
+    return {"status": "success", "refs": refs, "output_file": str(output_file)}
+
+
+def cache_result(cache_key: Optional[str], result: Dict) -> Dict:
+    """Store a successful LLM result under cache_key and return it unchanged."""
+    if cache_key is not None and result.get("status") == "success":
+        cache.set(cache_key, orjson.dumps({"refs": result["refs"]}))
+    return result
+
+
+def extract_references_with_llm(
+    txt_path: Path,
+    user_query: str,
+    model: Optional[str] = None,
+    provider: str = "claude",
+    semantic_cache: bool = False,
+) -> Dict:
+    """
+    Extract references from a text file using an LLM.
+
+    Args:
+        txt_path: Path to the converted text file
+        user_query: User's query about which references to extract
+        model: LLM model name (e.g., 'ministral-3', 'claude-haiku-4-5').
+               If None, generates manual template instead.
+        provider: LLM provider to use ('ollama' or 'claude')
+        semantic_cache: Also reuse cached responses for paraphrased queries
+
+    Returns:
+        Dictionary containing extracted references
+    """
+    prompt, cache_key, result = prepare_extraction(
+        txt_path, user_query, model, provider, semantic_cache
+    )
+    if result is not None:
+        return result
 
     # Route to appropriate LLM provider
     if provider == "claude":
-        return extract_with_claude(prompt, txt_path, model)
+        result = extract_with_claude(prompt, txt_path, model)
     else:  # provider == "ollama"
-        return extract_with_ollama(prompt, txt_path, model)
+        result = extract_with_ollama(prompt, txt_path, model)
+    return cache_result(cache_key, result)
 
 
-def extract_with_ollama(prompt: str, txt_path: Path, model: str) -> Dict:
+async def extract_references_with_llm_async(
+    txt_path: Path,
+    user_query: str,
+    model: Optional[str] = None,
+    provider: str = "claude",
+    semantic_cache: bool = False,
+) -> Dict:
     """
-    Extract references using Ollama local LLM.
+    Extract references from a text file using an async LLM client.
+
+    Same as extract_references_with_llm, but awaits the LLM call so many
+    papers can be in flight on one event loop.
 
     Args:
-        prompt: The extraction prompt
-        txt_path: Path to the text file being processed
-        model: Ollama model name (e.g., 'ministral-3', 'llama3.2')
+        txt_path: Path to the converted text file
+        user_query: User's query about which references to extract
+        model: LLM model name. If None, generates manual template instead.
+        provider: LLM provider to use ('ollama' or 'claude')
+        semantic_cache: Also reuse cached responses for paraphrased queries
 
     Returns:
-        Dictionary with extraction results
+        Dictionary containing extracted references
     """
-    try:
-        import ollama
+    # Reading the paper and the semantic cache (which runs an embedding
+    # model) would block the event loop and every request in flight
+    prompt, cache_key, result = await asyncio.to_thread(
+        prepare_extraction, txt_path, user_query, model, provider, semantic_cache
+    )
+    if result is not None:
+        return result
 
-        print("🤖 Using Ollama local LLM for extraction...")
-        print(f"   Model: {model}")
-        print("   (This may take a few moments)\n")
+    # Route to appropriate LLM provider
+    if provider == "claude":
+        result = await extract_with_claude_async(prompt, txt_path, model)
+    else:  # provider == "ollama"
+        result = await extract_with_ollama_async(prompt, txt_path, model)
+    return cache_result(cache_key, result)
 
-        # Call Ollama API
-        response = ollama.chat(
-            model=model,
-            messages=[{"role": "user", "content": prompt}],
-        )
 
-        result = response["message"]["content"]
+def references_output_file(txt_path: Path) -> Path:
+    """Return the JSON output path for a paper, creating the outputs folder."""
+    output_dir = Path("outputs")
+    output_dir.mkdir(exist_ok=True)
+    return output_dir / f"{txt_path.stem}_references.json"
+
+
+@functools.lru_cache(maxsize=1)
+def claude_client():
+    """Return the Claude client shared by all calls, reusing its connections."""
+    import anthropic
+
+    # Retry rate-limited/overloaded requests when papers run concurrently
+    return anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"), max_retries=5)
+
+
+@functools.lru_cache(maxsize=1)
+def ollama_client():
+    """Return the Ollama client shared by all calls, reusing its connections."""
+    import ollama
+
+    return ollama.Client()
+
 
-        # Save the LLM output to outputs folder
-        output_dir = Path("outputs")
-        output_dir.mkdir(exist_ok=True)
-        output_file = output_dir / f"{txt_path.stem}_references.txt"
+@functools.lru_cache(maxsize=1)
+def async_claude_client(loop: asyncio.AbstractEventLoop):
+    """Return the async Claude client shared by all calls on an event loop.
+
+    Async connections belong to the loop that opened them, so each loop (each
+    asyncio.run) gets its own client.
+    """
+    import anthropic
+
+    # Retry rate-limited/overloaded requests when papers run concurrently
+    return anthropic.AsyncAnthropic(
+        api_key=os.getenv("ANTHROPIC_API_KEY"), max_retries=5
+    )
 
-        with open(output_file, "w", encoding="utf-8") as f:
-            f.write(result)
 
-        print(f"✓ Results saved to: {output_file}\n")
+@functools.lru_cache(maxsize=1)
+def async_ollama_client(loop: asyncio.AbstractEventLoop):
+    """Return the async Ollama client shared by all calls on an event loop."""
+    import ollama
 
-        return {"status": "success", "output": result, "output_file": str(output_file)}
+    return ollama.AsyncClient()
+
+
+def ollama_chat_args(prompt: Dict, model: str) -> Dict:
+    """Build the ollama chat() arguments for an extraction prompt."""
+    return {
+        "model": model,
+        # Ollama takes plain string content
+        "messages": [
+            {"role": role, "content": "".join(b["text"] for b in prompt[role])}
+            for role in ("system", "user")
+        ],
+        "format": REFERENCES_SCHEMA,
+        "options": {"temperature": LLM_TEMPERATURE},
+        # Keep the model loaded between papers
+        "keep_alive": "10m",
+        "stream": True,
+    }
 
-    except ImportError:
+
+def claude_request_args(prompt: Dict, model: str) -> Dict:
+    """Build the Claude Messages API arguments for an extraction prompt."""
+    return {
+        "model": model,
+        "max_tokens": 8192,
+        "temperature": LLM_TEMPERATURE,
+        "system": list(prompt["system"]),
+        "messages": [{"role": "user", "content": prompt["user"]}],
+        "tools": [EXTRACTION_TOOL],
+        "tool_choice": {"type": "tool", "name": EXTRACTION_TOOL["name"]},
+    }
+
+
+def request_key(prompt: Dict, model: str, provider: str) -> str:
+    """Return the hash of the exact request body sent for a prompt."""
+    if provider == "claude":
+        request = claude_request_args(prompt, model)
+    else:
+        request = ollama_chat_args(prompt, model)
+    return cache.make_key(provider, orjson.dumps(request).decode())
+
+
+def print_llm_start(name: str, model: str) -> None:
+    """Print the banner shown before an LLM extraction call."""
+    print(f"🤖 Using {name} for extraction...")
+    print(f"   Model: {model}")
+    print("   (This may take a few moments)\n")
+
+
+def missing_api_key() -> Optional[Dict]:
+    """Return an error result if ANTHROPIC_API_KEY is not set, else None."""
+    if os.getenv("ANTHROPIC_API_KEY"):
+        return None
+    print("✗ ANTHROPIC_API_KEY environment variable not set")
+    print("  Please set your API key:")
+    print("  export ANTHROPIC_API_KEY=your_key_here\n")
+    return {"error": "ANTHROPIC_API_KEY not set"}
+
+
+def tool_refs(message) -> List[Dict]:
+    """Return the references from a Claude message's forced tool call."""
+    # The forced tool call carries the references as structured input
+    tool_use = next(block for block in message.content if block.type == "tool_use")
+    return tool_use.input["refs"]
+
+
+def extraction_success(refs: List[Dict], output_file: Path) -> Dict:
+    """Report extracted references and return the success result."""
+    print(f"✓ Extracted {len(refs)} reference(s)")
+    print(f"✓ Results saved to: {output_file}\n")
+    return {"status": "success", "refs": refs, "output_file": str(output_file)}
+
+
+def ollama_error(e: Exception, model: str) -> Dict:
+    """Report an Ollama extraction failure and return the error result."""
+    if isinstance(e, ImportError):
         print("⚠ Ollama not installed. Install with: uv add ollama")
         print("  Or install Ollama from: https://ollama.ai\n")
         return {"error": "Ollama not installed"}
-    except Exception as e:
-        print(f"✗ Error with Ollama: {str(e)}\n")
-        print(f"  Make sure the model '{model}' is available.")
-        print(f"  Pull it with: ollama pull {model}\n")
-        return {"error": str(e)}
+    print(f"✗ Error with Ollama: {str(e)}\n")
+    print(f"  Make sure the model '{model}' is available.")
+    print(f"  Pull it with: ollama pull {model}\n")
+    return {"error": str(e)}
+
+
+def claude_error(e: Exception, model: str) -> Dict:
+    """Report a Claude extraction failure and return the error result."""
+    if isinstance(e, ImportError):
+        print("⚠ Anthropic SDK not installed. Install with: uv add anthropic\n")
+        return {"error": "Anthropic SDK not installed"}
+    print(f"✗ Error with Claude API: {str(e)}\n")
+    print(f"  Make sure your API key is valid and the model '{model}' is accessible.\n")
+    return {"error": str(e)}
 
 
-def extract_with_claude(prompt: str, txt_path: Path, model: str) -> Dict:
+def extract_with_ollama(prompt: Dict, txt_path: Path, model: str) -> Dict:
     """
-    Extract references using Claude API.
+    Extract references using Ollama local LLM.
 
     Args:
-        prompt: The extraction prompt
+        prompt: The extraction prompt (system and user content blocks)
         txt_path: Path to the text file being processed
-        model: Claude model name (e.g., 'claude-haiku-4-5')
+        model: Ollama model name (e.g., 'ministral-3', 'llama3.2')
 
     Returns:
         Dictionary with extraction results
     """
     try:
-        import anthropic
+        print_llm_start("Ollama local LLM", model)
 
-        # Get API key from environment
-        api_key = os.getenv("ANTHROPIC_API_KEY")
-        if not api_key:
-            print("✗ ANTHROPIC_API_KEY environment variable not set")
-            print("  Please set your API key:")
-            print("  export ANTHROPIC_API_KEY=your_key_here\n")
-            return {"error": "ANTHROPIC_API_KEY not set"}
+        # Call Ollama API
+        stream = ollama_client().chat(**ollama_chat_args(prompt, model))
+
+        # Stream the LLM output to outputs folder as it is generated
+        # (unbuffered, so each chunk goes straight to the file descriptor)
+        output_file = references_output_file(txt_path)
+        chunks = []
+        with open(output_file, "wb", buffering=0) as f:
+            for chunk in stream:
+                content = chunk["message"]["content"].encode("utf-8")
+                f.write(content)
+                chunks.append(content)
+
+        return extraction_success(orjson.loads(b"".join(chunks))["refs"], output_file)
+    except Exception as e:
+        return ollama_error(e, model)
 
-        print("🤖 Using Claude API for extraction...")
-        print(f"   Model: {model}")
-        print("   (This may take a few moments)\n")
 
-        # Call Claude API
-        client = anthropic.Anthropic(api_key=api_key)
-        message = client.messages.create(
-            model=model,
-            max_tokens=8192,
-            messages=[{"role": "user", "content": prompt}],
-        )
+async def extract_with_ollama_async(prompt: Dict, txt_path: Path, model: str) -> Dict:
+    """Async version of extract_with_ollama, using the async Ollama client."""
+    try:
+        print_llm_start("Ollama local LLM", model)
+
+        # Call Ollama API
+        client = async_ollama_client(asyncio.get_running_loop())
+        stream = await client.chat(**ollama_chat_args(prompt, model))
+
+        # Stream the LLM output to outputs folder as it is generated
+        output_file = references_output_file(txt_path)
+        chunks = []
+        with open(output_file, "wb", buffering=0) as f:
+            async for chunk in stream:
+                content = chunk["message"]["content"].encode("utf-8")
+                f.write(content)
+                chunks.append(content)
+
+        return extraction_success(orjson.loads(b"".join(chunks))["refs"], output_file)
+    except Exception as e:
+        return ollama_error(e, model)
 
-        result = message.content[0].text
 
-        # Save the Claude output to outputs folder
-        output_dir = Path("outputs")
-        output_dir.mkdir(exist_ok=True)
-        output_file = output_dir / f"{txt_path.stem}_references.txt"
+def extract_with_claude(prompt: Dict, txt_path: Path, model: str) -> Dict:
+    """
+    Extract references using Claude API.
 
-        with open(output_file, "w", encoding="utf-8") as f:
-            f.write(result)
+    Args:
+        prompt: The extraction prompt (system and user content blocks)
+        txt_path: Path to the text file being processed
+        model: Claude model name (e.g., 'claude-haiku-4-5')
 
-        print(f"✓ Results saved to: {output_file}\n")
+    Returns:
+        Dictionary with extraction results
+    """
+    try:
+        error = missing_api_key()
+        if error:
+            return error
 
-        return {"status": "success", "output": result, "output_file": str(output_file)}
+        print_llm_start("Claude API", model)
 
-    except ImportError:
-        print("⚠ Anthropic SDK not installed. Install with: uv add anthropic\n")
-        return {"error": "Anthropic SDK not installed"}
+        # Call Claude API
+        output_file = references_output_file(txt_path)
+        with claude_client().messages.stream(
+            **claude_request_args(prompt, model)
+        ) as stream, open(output_file, "wb", buffering=0) as f:
+            # Stream the tool input JSON to outputs folder as it is generated
+            # (unbuffered, so each delta goes straight to the file descriptor)
+            for event in stream:
+                if event.type == "input_json":
+                    f.write(event.partial_json.encode("utf-8"))
+            message = stream.get_final_message()
+
+        return extraction_success(tool_refs(message), output_file)
     except Exception as e:
-        print(f"✗ Error with Claude API: {str(e)}\n")
-        print(
-            f"  Make sure your API key is valid and the model '{model}' is accessible.\n"
-        )
-        return {"error": str(e)}
+        return claude_error(e, model)
 
 
-def manual_extraction_template(
-    paper_text: str, user_query: str, txt_path: Path
-) -> Dict:
-    """
-    Provide a manual extraction template and instructions.
-    This is the default method when no LLM is configured.
-    """
-    print("📋 Manual Extraction Template Mode\n")
-    print(
-        "Since no LLM is configured, here's a template to manually extract references:\n"
-    )
+async def extract_with_claude_async(prompt: Dict, txt_path: Path, model: str) -> Dict:
+    """Async version of extract_with_claude, using the async Claude client."""
+    try:
+        error = missing_api_key()
+        if error:
+            return error
 
-    template = f"""
+        print_llm_start("Claude API", model)
+
+        # Call Claude API
+        client = async_claude_client(asyncio.get_running_loop())
+        output_file = references_output_file(txt_path)
+        async with client.messages.stream(
+            **claude_request_args(prompt, model)
+        ) as stream:
+            # Stream the tool input JSON to outputs folder as it is generated
+            with open(output_file, "wb", buffering=0) as f:
+                async for event in stream:
+                    if event.type == "input_json":
+                        f.write(event.partial_json.encode("utf-8"))
+            message = await stream.get_final_message()
+
+        return extraction_success(tool_refs(message), output_file)
+    except Exception as e:
+        return claude_error(e, model)
+
+
+# Fill-in script written for each paper in manual template mode
+MANUAL_TEMPLATE = string.Template("""
 # ============================================================================
 # MANUAL REFERENCE EXTRACTION TEMPLATE
-# Paper: {txt_path.name}
-# Query: {user_query}
+# Paper: ${paper_name}
+# Query: ${user_query}
 # ============================================================================
 
 import re
@@ -285,16 +798,16 @@ for citation in citations:
 
 # Step 4: Get unique reference numbers
 unique_refs = sorted(set(all_refs))
-print(f"Total unique references: {{len(unique_refs)}}")
-print(f"Reference numbers: {{unique_refs}}")
+print(f"Total unique references: {len(unique_refs)}")
+print(f"Reference numbers: {unique_refs}")
 
 # Step 5: Find each reference in the References section and add it here
-references = {{
+references = {
     # TODO: For each number in unique_refs, find the full reference
     # from the References section of the paper and add it like this:
     # 1: "Author Name. Paper Title. Conference/Journal, Year.",
     # 2: "Author Name. Paper Title. Conference/Journal, Year.",
-}}
+}
 
 # Step 6: Display results
 print("\\n" + "="*80)
@@ -303,7 +816,7 @@ print("="*80 + "\\n")
 
 for ref_num in unique_refs:
     if ref_num in references:
-        print(f"[{{ref_num}}] {{references[ref_num]}}")
+        print(f"[{ref_num}] {references[ref_num]}")
         print()
 
 # ============================================================================
@@ -313,7 +826,22 @@ for ref_num in unique_refs:
 # 3. Fill in the references dictionary with the full reference details
 # 4. Run the script to see the extracted references
 # ============================================================================
-"""
+""")
+
+
+def manual_extraction_template(user_query: str, txt_path: Path) -> Dict:
+    """
+    Provide a manual extraction template and instructions.
+    This is the default method when no LLM is configured.
+    """
+    print("📋 Manual Extraction Template Mode\n")
+    print(
+        "Since no LLM is configured, here's a template to manually extract references:\n"
+    )
+
+    template = MANUAL_TEMPLATE.substitute(
+        paper_name=txt_path.name, user_query=user_query
+    )
 
     # Save template
     output_dir = Path("tmp/extraction_templates")
@@ -337,15 +865,217 @@ for ref_num in unique_refs:
     }
 
 
+# Seconds between status checks of a submitted Message Batch
+BATCH_POLL_INTERVAL = 30
+
+# ID of the Message Batch being waited for, so an interrupted run can resume
+# it instead of paying for the same requests again
+BATCH_FILE = cache.CACHE_DIR / "batch.json"
+
+
+def collect_batch(
+    client,
+    batch_id: str,
+    pending: Dict[str, Tuple[List[int], Dict, Optional[str]]],
+    txt_files: List[Path],
+    results: List[Optional[Dict]],
+    resumed: bool = False,
+) -> None:
+    """
+    Wait for a Message Batch to end and record the results of its requests.
+
+    Requests are identified by their request_key. Results for papers in
+    pending are saved and removed from pending. Successful results for
+    requests no longer pending (from a resumed batch of an earlier query)
+    are still stored in the LLM cache, since they were paid for. A resumed
+    batch's failed or expired requests stay pending, so they are resubmitted.
+    """
+    batch = client.messages.batches.retrieve(batch_id)
+    while batch.processing_status != "ended":
+        time.sleep(BATCH_POLL_INTERVAL)
+        batch = client.messages.batches.retrieve(batch_id)
+
+    for entry in client.messages.batches.results(batch_id):
+        succeeded = entry.result.type == "succeeded"
+        if entry.custom_id not in pending:
+            if succeeded and LLM_TEMPERATURE == 0:
+                try:
+                    refs = tool_refs(entry.result.message)
+                    cache.set(entry.custom_id, orjson.dumps({"refs": refs}))
+                except Exception:
+                    pass  # Only a cache fill; no paper is waiting on it
+            continue
+        if resumed and not succeeded:
+            continue
+
+        indexes, _, cache_key = pending.pop(entry.custom_id)
+        names = ", ".join(txt_files[index].name for index in indexes)
+        if not succeeded:
+            print(f"✗ Batch request for {names} {entry.result.type}\n")
+            for index in indexes:
+                results[index] = {"error": f"Batch request {entry.result.type}"}
+            continue
+
+        # A malformed response must not cost the other papers their results
+        try:
+            refs = tool_refs(entry.result.message)
+            data = orjson.dumps({"refs": refs})
+            output_files = [references_output_file(txt_files[i]) for i in indexes]
+            for output_file in output_files:
+                output_file.write_bytes(data)
+        except Exception as e:
+            print(f"✗ Error reading batch result for {names}: {e!r}\n")
+            for index in indexes:
+                results[index] = {"error": repr(e)}
+            continue
+
+        for index, output_file in zip(indexes, output_files):
+            print(f"✓ {txt_files[index].name}: extracted {len(refs)} reference(s)")
+            print(f"✓ Results saved to: {output_file}\n")
+            results[index] = cache_result(
+                cache_key,
+                {"status": "success", "refs": refs, "output_file": str(output_file)},
+            )
+
+
+def batch_extract(
+    txt_files: List[Path], user_query: str, model: str, semantic_cache: bool = False
+) -> List[Dict]:
+    """
+    Extract references from many papers with one Claude Message Batch.
+
+    Batched requests cost half as much as regular ones, but the batch may
+    take minutes to hours to finish, so results are polled for. The batch ID
+    is kept in BATCH_FILE until its results are collected; if polling is
+    interrupted, the next batch run resumes that batch before submitting
+    the papers it didn't cover.
+
+    Args:
+        txt_files: Paths to the converted text files
+        user_query: User's query about which references to extract
+        model: Claude model name (e.g., 'claude-haiku-4-5')
+        semantic_cache: Also reuse cached responses for paraphrased queries
+
+    Returns:
+        One {"paper", "result"} dictionary per text file, in order
+    """
+    results = [None] * len(txt_files)
+    # Papers with identical requests share one batch request
+    pending = {}
+    for index, txt_file in enumerate(txt_files):
+        prompt, cache_key, result = prepare_extraction(
+            txt_file, user_query, model, "claude", semantic_cache
+        )
+        if result is not None:
+            results[index] = result
+            continue
+        custom_id = cache_key or request_key(prompt, model, "claude")
+        pending.setdefault(custom_id, ([], prompt, cache_key))[0].append(index)
+
+    # Check the API key is set in the environment
+    error = missing_api_key() if pending else None
+    if error:
+        for indexes, _, _ in pending.values():
+            for index in indexes:
+                results[index] = dict(error)
+        pending.clear()
+
+    if pending:
+        try:
+            import anthropic
+
+            client = claude_client()
+
+            if BATCH_FILE.exists():
+                batch_id = orjson.loads(BATCH_FILE.read_bytes())["id"]
+                print(f"⏳ Resuming Claude Message Batch {batch_id} from an earlier run\n")
+                try:
+                    collect_batch(
+                        client, batch_id, pending, txt_files, results, resumed=True
+                    )
+                except anthropic.NotFoundError:
+                    print(f"⚠ Batch {batch_id} no longer exists, submitting a new one\n")
+                BATCH_FILE.unlink()
+
+            if pending:
+                print(f"🤖 Submitting {len(pending)} request(s) as a Message Batch...")
+                print(f"   Model: {model}")
+                print("   (Batches can take from minutes up to 24 hours)\n")
+
+                requests = [
+                    {"custom_id": custom_id, "params": claude_request_args(prompt, model)}
+                    for custom_id, (_, prompt, _) in pending.items()
+                ]
+                batch = client.messages.batches.create(requests=requests)
+                cache.write_file(BATCH_FILE, orjson.dumps({"id": batch.id}))
+                collect_batch(client, batch.id, pending, txt_files, results)
+                BATCH_FILE.unlink()
+
+        except ImportError:
+            print("⚠ Anthropic SDK not installed. Install with: uv add anthropic\n")
+            error = "Anthropic SDK not installed"
+        except Exception as e:
+            print(f"✗ Error with Claude Message Batches API: {e!r}\n")
+            if BATCH_FILE.exists():
+                print("  The batch keeps running; rerun with --batch to collect it\n")
+            error = str(e) or repr(e)
+        else:
+            error = "Missing from batch results"
+
+        # Papers the batch never returned a result for
+        for indexes, _, _ in pending.values():
+            for index in indexes:
+                results[index] = {"error": error}
+
+    return [
+        {"paper": txt_file.name, "result": result}
+        for txt_file, result in zip(txt_files, results)
+    ]
+
+
+# Papers in flight at once with the async Claude client
+CLAUDE_MAX_CONCURRENCY = 10
+
+# Ollama's own default for OLLAMA_NUM_PARALLEL when memory allows
+OLLAMA_DEFAULT_PARALLEL = 4
+
+
+def check_semantic_cache() -> bool:
+    """Check the semantic cache can be used, printing install hints if not."""
+    if cache.semantic_available():
+        return True
+    print("⚠ The semantic cache needs sentence-transformers and faiss.")
+    print("  Install with: uv add sentence-transformers faiss-cpu")
+    print("  Continuing with the exact-match cache only.\n")
+    return False
+
+
+def finish_semantic_cache(hits_before: int, num_papers: int) -> None:
+    """Save the semantic index once per run and report this run's hits."""
+    cache.semantic_save()
+    hits = cache.stats["semantic_hits"] - hits_before
+    print(f"Semantic cache hits: {hits}/{num_papers} paper(s)\n")
+
+
 def extract_from_all_papers(
-    user_query: str, model: Optional[str] = None, provider: str = "claude"
+    user_query: str,
+    model: Optional[str] = None,
+    provider: str = "claude",
+    max_workers: int = 8,
+    semantic_cache: bool = False,
 ):
     """Extract references from all converted papers.
 
+    Papers are processed concurrently in a thread pool, since each LLM call
+    spends its time waiting on the network.
+
     Args:
         user_query: The extraction query
         model: LLM model name. If None, generates manual templates.
         provider: LLM provider to use ('ollama' or 'claude')
+        max_workers: Maximum number of papers processed at once
+        semantic_cache: Also reuse cached responses for paraphrased queries
+            (needs the optional sentence-transformers and faiss packages)
     """
     txt_dir = Path("tmp/txts")
     txt_files = list(txt_dir.glob("*.txt"))
@@ -359,11 +1089,102 @@ def extract_from_all_papers(
     print(f"Reference Extraction from {len(txt_files)} paper(s)")
     print(f"{'=' * 70}\n")
 
-    results = []
-    for txt_file in txt_files:
-        result = extract_references_with_llm(txt_file, user_query, model, provider)
-        results.append({"paper": txt_file.name, "result": result})
+    semantic_cache = semantic_cache and check_semantic_cache()
+    semantic_hits = cache.stats["semantic_hits"]
+
+    def extract(txt_file: Path) -> Dict:
+        result = extract_references_with_llm(
+            txt_file, user_query, model, provider, semantic_cache
+        )
+        return {"paper": txt_file.name, "result": result}
+
+    num_workers = max(1, min(max_workers, len(txt_files)))
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        results = list(executor.map(extract, txt_files))
+
+    if semantic_cache:
+        finish_semantic_cache(semantic_hits, len(txt_files))
+    return results
+
+
+async def extract_from_all_papers_async(
+    user_query: str,
+    model: Optional[str] = None,
+    provider: str = "claude",
+    max_concurrency: Optional[int] = None,
+    batch: bool = False,
+    semantic_cache: bool = False,
+):
+    """Extract references from all converted papers on one event loop.
+
+    Requests go through the async LLM clients and a semaphore caps how many
+    are in flight: CLAUDE_MAX_CONCURRENCY for Claude, and the server's
+    OLLAMA_NUM_PARALLEL for Ollama (more would only queue on the server).
+
+    Args:
+        user_query: The extraction query
+        model: LLM model name. If None, generates manual templates.
+        provider: LLM provider to use ('ollama' or 'claude')
+        max_concurrency: Maximum number of papers in flight at once
+        batch: Send all papers as one Claude Message Batch (see batch_extract)
+        semantic_cache: Also reuse cached responses for paraphrased queries
+            (needs the optional sentence-transformers and faiss packages)
+    """
+    txt_dir = Path("tmp/txts")
+    txt_files = list(txt_dir.glob("*.txt"))
+
+    if not txt_files:
+        print("⚠ No text files found in 'tmp/txts' folder.")
+        print("  Please run PDF conversion first.\n")
+        return
+
+    print(f"\n{'=' * 70}")
+    print(f"Reference Extraction from {len(txt_files)} paper(s)")
+    print(f"{'=' * 70}\n")
 
+    semantic_cache = semantic_cache and check_semantic_cache()
+    semantic_hits = cache.stats["semantic_hits"]
+
+    if batch and model is not None:
+        if provider == "claude":
+            results = await asyncio.to_thread(
+                batch_extract, txt_files, user_query, model, semantic_cache
+            )
+            if semantic_cache:
+                finish_semantic_cache(semantic_hits, len(txt_files))
+            return results
+        print("⚠ Batching is only supported with Claude; sending papers concurrently\n")
+
+    if max_concurrency is None:
+        if provider == "ollama":
+            # Follow the server's setting; a malformed value is ignored
+            max_concurrency = env_int("OLLAMA_NUM_PARALLEL")
+            if max_concurrency is None:
+                max_concurrency = OLLAMA_DEFAULT_PARALLEL
+        else:
+            max_concurrency = CLAUDE_MAX_CONCURRENCY
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def extract(txt_file: Path) -> Dict:
+        async with semaphore:
+            result = await extract_references_with_llm_async(
+                txt_file, user_query, model, provider, semantic_cache
+            )
+        return {"paper": txt_file.name, "result": result}
+
+    # One failed paper must not cancel the others
+    outcomes = await asyncio.gather(
+        *(extract(txt_file) for txt_file in txt_files), return_exceptions=True
+    )
+    results = []
+    for txt_file, outcome in zip(txt_files, outcomes):
+        if isinstance(outcome, Exception):
+            print(f"✗ Error processing {txt_file.name}: {str(outcome)}\n")
+            outcome = {"paper": txt_file.name, "result": {"error": str(outcome)}}
+        results.append(outcome)
+
+    if semantic_cache:
+        finish_semantic_cache(semantic_hits, len(txt_files))
     return results
 
 
@@ -1,8 +1,22 @@
+import mmap
 import re
 
-# Read the extracted text file
-with open('outputs/Wang 등 - 2025 - MonoFusion Sparse-View 4D Reconstruction via Monocular Fusion.txt', 'r', encoding='utf-8') as f:
-    text = f.read()
+# Matches "[N] reference text" up to the next reference, appendix, or page number
+REF_RE = re.compile(rb'\[(\d+)\]\s+(.*?)(?=\n\[|\nAppendix|\n\d+\n|\Z)', re.DOTALL)
+WS_RE = re.compile(r'\s+')
+
+# Memory-map the extracted text file so the References scan reads it in place
+txt_path = 'outputs/Wang 등 - 2025 - MonoFusion Sparse-View 4D Reconstruction via Monocular Fusion.txt'
+with open(txt_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as text:
+    # Find References section
+    references_start = text.find(b'References')
+    if references_start == -1:
+        references_start = text.find(b'[1]')
+
+    # Index every reference in a single pass (first occurrence wins)
+    references = {}
+    for num, body in REF_RE.findall(text, max(references_start, 0)):
+        references.setdefault(int(num), body.decode('utf-8'))
 
 # Reference numbers we're looking for
 ref_numbers = [2, 4, 7, 9, 18, 26, 30, 33, 35, 38, 40, 41, 50, 52, 54, 58, 64]
@@ -13,25 +27,11 @@ print("Section 2. Related Works")
 print("=" * 80)
 print()
 
-# Find References section
-references_start = text.find('References')
-if references_start == -1:
-    references_start = text.find('[1]')
-
-references_text = text[references_start:]
-
 # Extract each reference
 for ref_num in ref_numbers:
-    # Pattern to match reference number and its content
-    # Match from [N] to the next [N+1] or end
-    pattern = rf'\[{ref_num}\]\s+(.*?)(?=\n\[|\nAppendix|\n\d+\n|$)'
-
-    match = re.search(pattern, references_text, re.DOTALL)
-
-    if match:
-        ref_text = match.group(1).strip()
+    if ref_num in references:
         # Clean up the reference text - remove extra whitespace and line breaks
-        ref_text = re.sub(r'\s+', ' ', ref_text)
+        ref_text = WS_RE.sub(' ', references[ref_num].strip())
 
         print(f"[{ref_num}] {ref_text}")
         print()
@@ -3,12 +3,12 @@ Academic Paper Reference Extraction Tool
 Main orchestration script for the complete workflow
 """
 
+import asyncio
+import os
 from dataclasses import dataclass
 from pathlib import Path
 import shutil
 import tyro
-from convert_pdfs import convert_all_pdfs
-from extract_references import extract_from_all_papers
 
 
 def print_banner():
@@ -18,8 +18,15 @@ def print_banner():
     print("=" * 70)
 
 
-def clear_tmp_folders():
-    """Clear all files in tmp/txts and tmp/extraction_templates."""
+def clear_tmp_folders(keep_subdirs: bool = False):
+    """Clear all files in tmp/txts and tmp/extraction_templates.
+
+    tmp/pdf_cache and tmp/llm_cache are kept, so reruns reuse them.
+
+    Args:
+        keep_subdirs: Only delete the files directly in each folder, leaving
+            subdirectories and their contents in place
+    """
     folders_to_clear = [
         Path("tmp/txts"),
         Path("tmp/extraction_templates")
@@ -27,11 +34,17 @@ def clear_tmp_folders():
 
     for folder in folders_to_clear:
         if folder.exists():
-            # Remove all files in the folder
-            for item in folder.glob("*"):
-                if item.is_file():
-                    item.unlink()
-                    print(f"  Removed: {item}")
+            if keep_subdirs:
+                # scandir entries carry the file type from the directory
+                # listing, so no extra stat() is needed per entry
+                with os.scandir(folder) as entries:
+                    for entry in entries:
+                        if entry.is_file(follow_symlinks=False):
+                            os.unlink(entry.path)
+            else:
+                # Remove the whole folder in one recursive delete and recreate it
+                shutil.rmtree(folder)
+                folder.mkdir(parents=True, exist_ok=True)
             print(f"✓ Cleared: {folder}/")
         else:
             print(f"  Skipped (not found): {folder}/")
@@ -62,6 +75,21 @@ class Args:
 
         # Clear temporary files
         python main.py "Extract from Introduction" --clear
+
+        # Clear only the files, keeping subfolders in tmp/
+        python main.py "Extract from Introduction" --clear-files-only
+
+        # Re-convert PDFs even if up to date
+        python main.py "Extract from Introduction" --force-refresh
+
+        # Slower, layout-preserving text extraction with pdfplumber
+        python main.py "Extract from Introduction" --precise
+
+        # Half-price Claude Message Batch (results may take a while)
+        python main.py "Extract all references" --batch
+
+        # Reuse cached results for paraphrased queries
+        python main.py "Get the references in the introduction" --semantic-cache
     """
 
     query: str
@@ -79,33 +107,63 @@ class Args:
     extract: bool = True
     """Extract references with LLM (default: True). Use --no-extract for manual template only."""
 
-    clear: bool = True
-    """Clear temporary files in tmp/ before processing (default: True)"""
+    clear: bool = False
+    """Clear tmp/txts and tmp/extraction_templates before processing; PDFs are still restored from tmp/pdf_cache, use --force-refresh to re-parse them (default: False)"""
 
+    clear_files_only: bool = False
+    """Clear only the files in tmp/txts and tmp/extraction_templates, keeping any subfolders (default: False)"""
 
-def main():
-    """Main entry point."""
-    print_banner()
+    force_refresh: bool = False
+    """Re-convert PDFs even if their text files are up to date (default: False)"""
+
+    precise: bool = False
+    """Convert PDFs with pdfplumber's layout-preserving extraction; slower than the default backend (default: False)"""
 
-    args = tyro.cli(Args, description=Args.__doc__)
+    batch: bool = False
+    """Send all papers as one Claude Message Batch at half price; results may take minutes to hours (default: False)"""
 
-    # Set default model based on provider if not specified
-    if not args.model:
+    semantic_cache: bool = False
+    """Reuse cached LLM results for similar (paraphrased) queries on the same paper; needs sentence-transformers and faiss (default: False)"""
+
+
+async def run_async(args: Args):
+    """Run the workflow for already-parsed arguments on the running event loop.
+
+    Lets services and notebooks that already run an event loop (an async
+    FastAPI handler, Jupyter) call the tool without going through tyro, e.g.
+    await run_async(Args(query="Extract all references", provider="ollama")).
+    """
+    # Use the default model for the provider if none was given
+    model = args.model
+    if not model:
         if args.provider == "claude":
-            args.model = "claude-haiku-4-5"
+            model = "claude-haiku-4-5"
         else:  # ollama
-            args.model = "ministral-3"
+            model = "ministral-3"
 
     # Step 0: Clear temporary files if requested
-    if args.clear:
+    if args.clear or args.clear_files_only:
         print("\n🗑️  Clearing temporary files...\n")
-        clear_tmp_folders()
+        clear_tmp_folders(keep_subdirs=args.clear_files_only)
         print()
 
     # Step 1: Convert PDFs (if enabled)
     if args.convert:
+        # Nothing to convert: stop before starting any worker processes
+        if not any(Path("inputs").glob("*.pdf")):
+            print("\n❌ No PDFs to process. Please add PDF files to inputs/")
+            return
+
         print("\n📄 Step 1: Converting PDFs to text...\n")
-        num_converted = convert_all_pdfs()
+        # Pipeline modules are imported only when their step runs, so
+        # --help and --no-convert runs skip them
+        from convert_pdfs import convert_all_pdfs
+
+        # Conversion blocks until its worker processes finish, so keep it
+        # off the event loop
+        num_converted = await asyncio.to_thread(
+            convert_all_pdfs, force_refresh=args.force_refresh, precise=args.precise
+        )
 
         if num_converted == 0:
             print("\n❌ No PDFs to process. Please add PDF files to inputs/")
@@ -114,20 +172,53 @@ def main():
         print("\n⏭️  Skipping PDF conversion (--no-convert)\n")
 
     # Step 2: Extract references (if enabled)
+    # Nothing to extract from: stop before loading the LLM clients
+    if not any(Path("tmp/txts").glob("*.txt")):
+        print("\n❌ No text files to process. Convert PDFs first (drop --no-convert)")
+        return
+
+    from extract_references import extract_from_all_papers_async
+
     if args.extract:
         print("\n🔍 Step 2: Extracting references...\n")
         print(f"Query: {args.query}")
         print(f"Provider: {args.provider}")
-        print(f"Model: {args.model}\n")
-        extract_from_all_papers(args.query, model=args.model, provider=args.provider)
+        print(f"Model: {model}\n")
+        await extract_from_all_papers_async(
+            args.query,
+            model=model,
+            provider=args.provider,
+            batch=args.batch,
+            semantic_cache=args.semantic_cache,
+        )
     else:
         print("\n📝 Step 2: Generating manual template...\n")
         print(f"Query: {args.query}")
         print("Mode: Manual template generation\n")
-        extract_from_all_papers(args.query, model=None, provider=args.provider)
+        await extract_from_all_papers_async(
+            args.query, model=None, provider=args.provider
+        )
 
     print("\n✅ Process complete!\n")
 
 
+def run(args: Args):
+    """Run the workflow for already-parsed arguments.
+
+    Lets scripts call the tool repeatedly without going through tyro, e.g.
+    run(Args(query="Extract all references", provider="ollama")). It starts
+    its own event loop, so it must be called from synchronous code; use
+    run_async where an event loop is already running.
+    """
+    asyncio.run(run_async(args))
+
+
+def main():
+    """Main entry point."""
+    print_banner()
+
+    run(tyro.cli(Args, description=Args.__doc__))
+
+
 if __name__ == "__main__":
     main()
@@ -1,23 +1,35 @@
-import pdfplumber
-import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
+from tqdm import tqdm
+from convert_pdfs import iter_pages_parallel, write_pages
+from utils import check_pdf, is_up_to_date, worker_count
 
-def convert_pdf_to_text(pdf_path, output_path):
-    """Convert a single PDF file to text."""
+# pdf_to_text.py extracts with PDFium; convert_pdfs.py's default is PyMuPDF
+BACKEND = "pypdfium2"
+
+def convert_pdf_to_text(pdf_path, output_path, max_workers=None):
+    """Convert a single PDF file to text, streaming page by page to disk.
+
+    Uses the same page extraction as convert_pdfs.py: a large PDF is split
+    into page ranges across up to max_workers processes (default:
+    utils.worker_count()).
+
+    Returns None on success, or the message to report. Workers don't print,
+    so the driver can write messages above its progress bar.
+    """
     try:
-        with pdfplumber.open(pdf_path) as pdf:
-            text = ""
-            for page in pdf.pages:
-                text += page.extract_text()
+        problem = check_pdf(pdf_path)
+        if problem:
+            return f"Skipping {pdf_path.name}: {problem}"
 
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(text)
+        pages = iter_pages_parallel(pdf_path, BACKEND, max_workers or worker_count())
+        write_pages(pages, output_path)
 
-        print(f"Successfully converted: {pdf_path.name} -> {output_path.name}")
-        return True
+        return None
     except Exception as e:
-        print(f"Error converting {pdf_path.name}: {str(e)}")
-        return False
+        # Don't leave a partial text file that would look up to date
+        output_path.unlink(missing_ok=True)
+        return f"Error converting {pdf_path.name}: {str(e)}"
 
 def main():
     # Define input and output directories
@@ -37,16 +49,42 @@ def main():
 
     print(f"Found {len(pdf_files)} PDF file(s) to convert.\n")
 
-    # Convert each PDF file
-    successful = 0
+    # Create output filenames (replace .pdf with .txt), skipping PDFs whose
+    # text file is newer than the PDF
+    pending = []
     for pdf_file in pdf_files:
-        # Create output filename (replace .pdf with .txt)
         output_file = output_dir / f"{pdf_file.stem}.txt"
+        if not is_up_to_date(pdf_file, output_file):
+            pending.append((pdf_file, output_file))
+    up_to_date = len(pdf_files) - len(pending)
 
-        if convert_pdf_to_text(pdf_file, output_file):
-            successful += 1
+    # Convert PDFs in parallel, one file per worker; spare CPUs go to each
+    # file's page workers so the total stays within the available CPUs
+    successful = 0
+    if pending:
+        num_cpus = worker_count()
+        file_workers = min(num_cpus, len(pending))
+        page_workers = max(1, num_cpus // file_workers)
+        with ProcessPoolExecutor(max_workers=file_workers) as executor:
+            # Map each future to its PDF's size so progress is shown in bytes
+            futures = {}
+            for pdf_file, output_file in pending:
+                future = executor.submit(
+                    convert_pdf_to_text, pdf_file, output_file, page_workers
+                )
+                futures[future] = pdf_file.stat().st_size
+            with tqdm(total=sum(futures.values()), unit="B", unit_scale=True) as bar:
+                for future in as_completed(futures):
+                    message = future.result()
+                    if message:
+                        # Printed above the bar instead of onto it
+                        tqdm.write(message)
+                    else:
+                        successful += 1
+                    bar.update(futures[future])
 
-    print(f"\nConversion complete: {successful}/{len(pdf_files)} files converted successfully.")
+    print(f"\nConversion complete: {successful}/{len(pending)} files converted successfully "
+          f"({up_to_date} already up to date).")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,204 @@
+"""Tests for narrowing paper text to the queried section and the LLM cache key."""
+
+import re
+
+import extract_references
+from extract_references import (
+    find_headings,
+    find_sections,
+    prepare_extraction,
+    select_relevant_text,
+)
+
+PAPER = """Title of the Paper
+Abstract
+We study things [1].
+1 Introduction
+Prior work [1, 2] motivates this.
+2 Related Work
+2.1 Dynamics scene reconstruction
+Dynamic scenes were reconstructed in [3].
+2.2 Other work
+Other work includes [4].
+3 Methods
+We follow [5] to build the model. The values we report
+4 The values in the table are shown
+in Table 1, computed as in [6].
+3 Baseline 45.2 67.1
+The baseline [7] is weaker.
+4 Experiments
+We evaluate on [8].
+5 Conclusion
+We conclude.
+References
+[1] A. Author. First paper.
+[2] B. Author. Second paper.
+"""
+
+BODY = PAPER[: PAPER.index("References")]
+
+
+def heading_titles(body):
+    return [match.group(2) for match, _ in find_headings(body)]
+
+
+def test_find_headings_follows_the_outline():
+    body = "1 Introduction\ntext\n2 Method\n2.1 Setup\n2.2 Data\n3 Results\n"
+    assert heading_titles(body) == ["Introduction", "Method", "Setup", "Data", "Results"]
+
+
+def test_find_headings_skips_table_rows_and_sentences():
+    body = (
+        "1 Introduction\n"
+        "2 Method\n"
+        "3 Baseline 45.2 67.1\n"
+        "7 Of the runs failed, as expected.\n"
+        "3 Results\n"
+    )
+    assert heading_titles(body) == ["Introduction", "Method", "Results"]
+
+
+def test_find_headings_skips_numbers_out_of_order():
+    body = "1 Introduction\n5 Points Are Sampled\n2 Method\n"
+    assert heading_titles(body) == ["Introduction", "Method"]
+
+
+def test_find_headings_ambiguous_outline():
+    assert find_headings(BODY) is None
+
+
+OUTLINED = """1 Introduction
+3D reconstruction is studied in [1].
+2 Related Work
+Dynamic scene reconstruction. Scenes that move were handled in [2].
+Static scenes. 3D reconstruction of static scenes is covered in [3].
+3 Method
+We compare against baselines [4] and build on [5].
+4 Results
+Our 3D reconstruction beats [4].
+5 Discussion
+The paper's limits aren't new [6].
+"""
+
+
+def sections(query, body=OUTLINED):
+    spans = find_sections(body, query)
+    return None if spans is None else [body[start:end] for start, end in spans]
+
+
+def section(title, body=OUTLINED):
+    start = body.index(title)
+    headings = [m.start() for m in re.finditer(r"^\d ", body, re.MULTILINE)]
+    return body[start : next((h for h in headings if h > start), len(body))]
+
+
+def test_find_sections_by_name():
+    assert sections("Extract all references cited in the Introduction section") == [
+        section("1 Introduction")
+    ]
+    assert sections("Extract all references from the Related Work section") == [
+        section("2 Related Work")
+    ]
+    assert sections("Extract references from the Methodology section") == [
+        section("3 Method")
+    ]
+
+
+def test_find_sections_returns_every_named_section():
+    assert sections("List all references in Results and Discussion") == [
+        section("4 Results") + section("5 Discussion")
+    ]
+    # All named sections are kept, whatever order the query names them in
+    assert sections(
+        "Extract references in the Method section that are also cited in the introduction"
+    ) == [section("1 Introduction"), section("3 Method")]
+
+
+def test_find_sections_by_paragraph_title():
+    assert sections(
+        "Extract references from the paragraph titled 'Dynamic scene reconstruction'"
+    ) == ["Dynamic scene reconstruction. Scenes that move were handled in [2].\n"
+          "Static scenes. 3D reconstruction of static scenes is covered in [3].\n"]
+
+
+def test_find_sections_paragraph_title_with_apostrophes():
+    assert sections(
+        "List the paper's references in the paragraph titled 'Static scenes' "
+        "that aren't new"
+    ) == ["Static scenes. 3D reconstruction of static scenes is covered in [3].\n"]
+
+
+def test_find_sections_by_number():
+    assert sections("Extract references from Section 2") == [section("2 Related Work")]
+
+
+def test_find_sections_needs_every_target():
+    # There is no Experiments heading, so the full text is used
+    assert sections("List all references in the Method and Experiments sections") is None
+
+
+def test_find_sections_ignores_topic_queries():
+    for query in (
+        "Extract all references related to '3D reconstruction'",
+        "Extract all references to methods that are compared as baselines",
+        "Find all references about datasets and evaluation metrics",
+        "Extract references from paragraphs about 'neural networks' and 'deep learning'",
+    ):
+        assert sections(query) is None, query
+
+
+def test_find_sections_not_cut_at_wrapped_line():
+    # "4 The values..." looks like a heading, so the section isn't trusted
+    assert find_sections(BODY, "Extract references from the Methods section") is None
+    text = select_relevant_text(PAPER, "Extract references from the Methods section")
+    assert "[6]" in text and "[7]" in text
+
+
+def test_select_relevant_text_keeps_section_and_references():
+    text = select_relevant_text(
+        "1 Introduction\nintro [1]\n2 Methods\nmethods [2]\nReferences\n[1] A.\n[2] B.\n",
+        "Extract references from the Introduction",
+    )
+    assert text == "1 Introduction\nintro [1]\n\n\n[REFERENCES]\nReferences\n[1] A.\n[2] B.\n"
+
+
+def test_select_relevant_text_trims_references_before_section():
+    intro = "1 Introduction\n" + "Prior work [1] is cited here.\n" * 20
+    references = "References\n" + "".join(
+        f"[{i}] Author {i}. A paper title.\n" for i in range(1, 701)
+    )
+    paper = intro + "2 Methods\nmethods\n" + references
+    max_chars = 2_000
+
+    text = select_relevant_text(
+        paper, "Extract references from the Introduction", max_chars
+    )
+    assert len(text) == max_chars
+    assert text.startswith(intro)
+    assert "\n[REFERENCES]\nReferences\n[1] Author 1." in text
+
+
+def test_select_relevant_text_keeps_references_without_section():
+    body = "Title\n" + "Prior work [1] is cited here.\n" * 200
+    references = "References\n[1] A. Author. First paper.\n"
+    max_chars = 2_000
+
+    text = select_relevant_text(body + references, "Extract all references", max_chars)
+    assert len(text) == max_chars
+    assert text.startswith("Title\n")
+    assert text.endswith(references)
+
+
+def test_cache_key_covers_the_request(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    paper = tmp_path / "paper.txt"
+    paper.write_text("1 Introduction\nintro [1]\nReferences\n[1] A.\n")
+    query = "Extract references from the Introduction"
+
+    _, key, _ = prepare_extraction(paper, query, "model", "claude")
+    extract_references.create_system_prompt.cache_clear()
+    monkeypatch.setattr(extract_references, "EXTRACTION_SYSTEM_PROMPT", "Changed.")
+    _, changed_key, _ = prepare_extraction(paper, query, "model", "claude")
+    extract_references.create_system_prompt.cache_clear()
+
+    assert key != changed_key
@@ -0,0 +1,34 @@
+"""Tests for the shared environment, worker count and PDF helpers."""
+
+from utils import check_pdf, env_int, worker_count
+
+
+def test_worker_count_override(monkeypatch):
+    monkeypatch.setenv("LITQ_WORKERS", "3")
+    assert worker_count() == 3
+
+
+def test_worker_count_override_at_least_one(monkeypatch):
+    monkeypatch.setenv("LITQ_WORKERS", "0")
+    assert worker_count() == 1
+
+
+def test_worker_count_ignores_malformed_override(monkeypatch, capsys):
+    monkeypatch.delenv("LITQ_WORKERS", raising=False)
+    default = worker_count()
+
+    monkeypatch.setenv("LITQ_WORKERS", "auto")
+    assert worker_count() == default
+    assert "Ignoring LITQ_WORKERS='auto'" in capsys.readouterr().out
+
+
+def test_check_pdf_rejects_non_pdf(tmp_path):
+    path = tmp_path / "paper.pdf"
+    path.write_text("<html>not a pdf</html>")
+    assert check_pdf(path) == "not a PDF file (no %PDF- header)"
+
+
+def test_env_int_ignores_malformed_value(monkeypatch, capsys):
+    monkeypatch.setenv("OLLAMA_NUM_PARALLEL", "auto")
+    assert env_int("OLLAMA_NUM_PARALLEL") is None
+    assert "Ignoring OLLAMA_NUM_PARALLEL='auto'" in capsys.readouterr().out
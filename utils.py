@@ -0,0 +1,86 @@
+"""
+Shared Utilities
+Helpers shared by the PDF conversion pipeline, pdf_to_text.py and reference
+extraction
+"""
+
+import os
+from typing import Optional
+
+
+def env_int(name: str) -> Optional[int]:
+    """Return an environment variable as a whole number, or None if unset.
+
+    A value that isn't a whole number is ignored with a warning, so a typo
+    falls back to the default instead of crashing the run.
+    """
+    value = os.getenv(name)
+    if value:
+        try:
+            return int(value)
+        except ValueError:
+            print(f"⚠ Ignoring {name}={value!r}: expected a whole number")
+    return None
+
+
+def worker_count() -> int:
+    """Return how many worker processes to run for CPU-bound work.
+
+    Counts the CPUs this process may actually run on (its affinity set, which
+    container CPU pinning restricts) rather than every CPU on the machine,
+    and keeps one of them free for the main process. Set LITQ_WORKERS to
+    override; a value that isn't a whole number is ignored with a warning.
+    """
+    override = env_int("LITQ_WORKERS")
+    if override is not None:
+        return max(1, override)
+
+    if hasattr(os, "sched_getaffinity"):
+        num_cpus = len(os.sched_getaffinity(0))
+    else:  # Windows and macOS
+        num_cpus = os.cpu_count() or 1
+    return max(1, num_cpus - 1)
+
+
+def count_pages(pdf_path) -> int:
+    """Return the number of pages in a PDF."""
+    import pymupdf
+
+    with pymupdf.open(pdf_path) as doc:
+        return doc.page_count
+
+
+def needs_password(pdf_path) -> bool:
+    """Check whether a PDF is encrypted with a user password.
+
+    Only the document trailer and cross-reference table are read. PDFs
+    encrypted with an empty user password (owner restrictions only) open
+    normally and are not reported.
+    """
+    import pymupdf
+
+    with pymupdf.open(pdf_path) as doc:
+        return bool(doc.needs_pass)
+
+
+def check_pdf(pdf_path):
+    """Return why a PDF can't be converted, or None if it looks convertible.
+
+    Catches files that are not PDFs and password-protected PDFs before any
+    page is parsed, so they fail fast instead of midway through extraction.
+    """
+    # The %PDF- header must appear within the first 1024 bytes
+    with open(pdf_path, 'rb') as f:
+        if b"%PDF-" not in f.read(1024):
+            return "not a PDF file (no %PDF- header)"
+    if needs_password(pdf_path):
+        return "encrypted, a password is required"
+    return None
+
+
+def is_up_to_date(pdf_path, output_path) -> bool:
+    """Check whether the text file exists and is not older than its PDF."""
+    try:
+        return output_path.stat().st_mtime >= pdf_path.stat().st_mtime
+    except FileNotFoundError:
+        return False